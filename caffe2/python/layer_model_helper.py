@@ -18,14 +18,22 @@ from caffe2.python.optimizer import get_param_device
 from caffe2.python.regularizer import Regularizer, RegularizationBy
 from caffe2.python.layers import layers
 from caffe2.proto import caffe2_pb2
-from future.utils import viewitems, viewvalues
 
+import hashlib
 import logging
 import numpy as np
 import six
-import copy
 logger = logging.getLogger(__name__)
 
+# Fill op used for global constants of a given dtype, anything else (e.g.
+# floats) goes to GivenTensorFill. String arrays are matched by dtype kind as
+# their dtype depends on the length of the strings.
+_GLOBAL_CONSTANT_FILL_OPS = {
+    np.dtype(np.int32): 'GivenTensorIntFill',
+    np.dtype(np.int64): 'GivenTensorInt64Fill',
+    np.dtype(np.bool_): 'GivenTensorBoolFill',
+}
+
 
 class LayerModelHelper(model_helper.ModelHelper):
     """
@@ -46,6 +54,8 @@ class LayerModelHelper(model_helper.ModelHelper):
 
         super(LayerModelHelper, self).__init__(name=name)
         self._layer_names = set()
+        # next '_auto_' index to try for each base layer name
+        self._layer_name_counters = {}
         self._layers = []
         self._param_to_shape = {}
 
@@ -59,6 +69,11 @@ class LayerModelHelper(model_helper.ModelHelper):
 
         self._default_optimizer = None
         self._loss = None
+        # whether self._loss is a Struct built by add_loss, and thus safe to
+        # extend in place
+        self._loss_is_owned = False
+        # next '_auto_' index to try for each loss name
+        self._loss_name_counters = {}
         self._prediction = []
         self._output_schema = None
 
@@ -102,9 +117,17 @@ class LayerModelHelper(model_helper.ModelHelper):
     def add_metric_field(self, name, value):
         assert name not in self._metrics_schema.fields, (
             "Try to add metric field twice: {}".format(name))
-        self._metrics_schema = self._metrics_schema + schema.Struct(
-            (name, value)
-        )
+        self._metrics_schema = self._append_schema_field(
+            self._metrics_schema, name, value)
+
+    @staticmethod
+    def _append_schema_field(struct, name, value):
+        # Appending in place avoids rebuilding the whole Struct on every call;
+        # nested names still go through '+' so that they get merged properly.
+        if schema.FIELD_SEPARATOR in name:
+            return struct + schema.Struct((name, value))
+        struct.append_field(name, value)
+        return struct
 
     def add_ad_hoc_plot_blob(self, blob, dtype=None):
         assert isinstance(
@@ -129,30 +152,48 @@ class LayerModelHelper(model_helper.ModelHelper):
                 array = np.array(array, dtype=dtype)
 
             # TODO: make GivenTensor generic
-            op_name = None
-            if array.dtype == np.int32:
-                op_name = 'GivenTensorIntFill'
-            elif array.dtype == np.int64:
-                op_name = 'GivenTensorInt64Fill'
-            elif array.dtype == np.str:
+            if array.dtype.kind in ('U', 'S'):
                 op_name = 'GivenTensorStringFill'
-            elif array.dtype == np.bool:
-                op_name = 'GivenTensorBoolFill'
             else:
-                op_name = 'GivenTensorFill'
+                op_name = _GLOBAL_CONSTANT_FILL_OPS.get(
+                    array.dtype, 'GivenTensorFill')
 
             def initializer(blob_name):
                 return core.CreateOperator(
                     op_name, [],
                     blob_name,
                     shape=array.shape,
-                    values=array.flatten().tolist()
+                    # MakeArgument unpacks ndarrays itself, so there is no
+                    # need to build an intermediate python list here
+                    values=array
                 )
         else:
             assert initializer is not None
         initializer_op = initializer(blob_name)
         return initializer_op
 
+    @staticmethod
+    def _get_global_constant_fingerprint(
+        array=None, dtype=None, initializer=None
+    ):
+        # Digest of everything the initializer op built from these args
+        # depends on: the value and the current device scope, which
+        # CreateOperator copies into the op. Equal digests thus imply equal
+        # ops. Constants built by a custom initializer or holding python
+        # objects have no fingerprint.
+        if array is None or initializer is not None:
+            return None
+        array = np.asarray(array, dtype=dtype)
+        if array.dtype.hasobject:
+            return None
+        fingerprint = hashlib.sha1(array.dtype.str.encode('utf-8'))
+        fingerprint.update(str(array.shape).encode('utf-8'))
+        fingerprint.update(np.ascontiguousarray(array).tobytes())
+        device_option = scope.CurrentDeviceScope()
+        if device_option is not None:
+            fingerprint.update(device_option.SerializeToString())
+        return fingerprint.digest()
+
     def add_global_constant(
         self, name, array=None, dtype=None, initializer=None
     ):
@@ -180,6 +221,15 @@ class LayerModelHelper(model_helper.ModelHelper):
 
         if name in self.global_constants:
             blob_name = self.global_constants[name]
+            # args already checked against the registered initializer, no need
+            # to build and compare the op again
+            fingerprint = LayerModelHelper._get_global_constant_fingerprint(
+                *args, **kwargs
+            )
+            if fingerprint is not None and fingerprint == \
+                    self._global_constant_fingerprints.get(blob_name):
+                return blob_name
+
             initializer_op = \
                 LayerModelHelper._get_global_constant_initializer_op(
                     blob_name, *args, **kwargs
@@ -195,19 +245,23 @@ class LayerModelHelper(model_helper.ModelHelper):
                 "previous %s, now %s" % (
                     blob_name, str(initializer_op),
                     str(self.global_constant_initializers[blob_name]))
+            # fingerprints are only computed here, so that constants which are
+            # never re-added don't pay for hashing
+            if fingerprint is not None:
+                self._global_constant_fingerprints[blob_name] = fingerprint
             return blob_name
         return self.add_global_constant(name, *args, **kwargs)
 
     def _init_global_constants(self):
         self.global_constants = {}
         self.global_constant_initializers = {}
+        self._global_constant_fingerprints = {}
         self.add_global_constant('ONE', 1.0)
         self.add_global_constant('ZERO', 0.0)
         self.add_global_constant('ZERO_RANGE', [0, 0], dtype='int32')
 
     def _add_global_constants(self, init_net):
-        for initializer_op in viewvalues(self.global_constant_initializers):
-            init_net._net.op.extend([initializer_op])
+        init_net._net.op.extend(self.global_constant_initializers.values())
 
     def create_init_net(self, name):
         init_net = core.Net(name)
@@ -215,10 +269,9 @@ class LayerModelHelper(model_helper.ModelHelper):
         return init_net
 
     def _validate_param_shape(self, param_name, shape):
-        if param_name not in self._param_to_shape:
-            return
-
-        ref_shape = self._param_to_shape[param_name]
+        # a single lookup; params seen for the first time default to their own
+        # shape. None is a valid stored shape, so it can't be the default.
+        ref_shape = self._param_to_shape.get(param_name, shape)
 
         if shape != ref_shape:
             raise ValueError(
@@ -230,13 +283,14 @@ class LayerModelHelper(model_helper.ModelHelper):
 
     def create_param(self, param_name, shape, initializer, optimizer=None,
                      ps_param=None, regularizer=None):
-        if isinstance(param_name, core.BlobReference):
-            param_name = str(param_name)
-        elif isinstance(param_name, six.string_types):
+        # strings are by far the most common input, so check them first
+        if isinstance(param_name, six.string_types):
             # Parameter name will be equal to current Namescope that got
             # resolved with the respect of parameter sharing of the scopes.
             param_name = parameter_sharing_context.get_parameter_name(
                 param_name)
+        elif isinstance(param_name, core.BlobReference):
+            param_name = str(param_name)
         else:
             raise ValueError("Unsupported type for param_name")
 
@@ -246,7 +300,9 @@ class LayerModelHelper(model_helper.ModelHelper):
             init_op_args = {}
         else:
             assert len(initializer) == 2
-            init_op_args = copy.deepcopy(initializer[1])
+            # only 'shape' gets added below and the values are passed on
+            # untouched, so a shallow copy keeps the caller's dict intact
+            init_op_args = dict(initializer[1])
         if shape is not None:
             assert 'shape' not in init_op_args
             init_op_args.update({'shape': shape})
@@ -277,25 +333,37 @@ class LayerModelHelper(model_helper.ModelHelper):
     def next_layer_name(self, prefix):
         base_name = core.ScopedName(prefix)
         name = base_name
-        index = 0
-        while name in self._layer_names:
+        if name in self._layer_names:
+            # resume from the last allocated index instead of probing every
+            # previously generated name again
+            index = self._layer_name_counters.get(base_name, 0)
             name = base_name + '_auto_' + str(index)
-            index += 1
+            while name in self._layer_names:
+                index += 1
+                name = base_name + '_auto_' + str(index)
+            self._layer_name_counters[base_name] = index + 1
 
         self._layer_names.add(name)
         return name
 
     def add_layer(self, layer):
         self._layers.append(layer)
+        # bind the lookups used for every parameter once, layers such as
+        # embeddings can own a lot of them
+        param_to_optim = self.param_to_optim
+        param_to_reg = self.param_to_reg
+        params_append = self.params.append
+        default_optimizer = self.default_optimizer
         for param in layer.get_parameters():
-            assert isinstance(param.parameter, core.BlobReference)
+            param_blob = param.parameter
+            assert isinstance(param_blob, core.BlobReference)
 
-            self.param_to_optim[str(param.parameter)] = \
-                param.optimizer or self.default_optimizer
+            param_to_optim[str(param_blob)] = \
+                param.optimizer or default_optimizer
 
-            self.params.append(param.parameter)
+            params_append(param_blob)
             if isinstance(param, layers.LayerParameter):
-                self.param_to_reg[param.parameter] = param.regularizer
+                param_to_reg[param_blob] = param.regularizer
             elif isinstance(param, ParameterInfo):
                 # TODO:
                 # Currently, LSTM and RNNcells, which use ModelHelper instead of
@@ -317,12 +385,11 @@ class LayerModelHelper(model_helper.ModelHelper):
         return layer.output_schema
 
     def get_parameter_blobs(self):
-        param_blobs = []
-        for layer in self._layers:
-            for param in layer.get_parameters():
-                param_blobs.append(param.parameter)
-
-        return param_blobs
+        return [
+            param.parameter
+            for layer in self._layers
+            for param in layer.get_parameters()
+        ]
 
     def add_post_grad_net_modifiers(self, modifier):
         assert modifier not in self._post_grad_net_modifiers,\
@@ -432,20 +499,29 @@ class LayerModelHelper(model_helper.ModelHelper):
         ), "Added loss should be a scalar or a struct"
         if self._loss is None:
             self._loss = schema.Struct((name, loss))
+            self._loss_is_owned = True
         else:
             # loss could've been set through model.loss directly which could be
             # a scalar
             if isinstance(self._loss, schema.Scalar):
                 self._loss = schema.Struct(('unnamed', self._loss))
+                self._loss_is_owned = True
+            elif not self._loss_is_owned:
+                # don't modify a Struct that was passed in by the caller
+                self._loss = schema.Struct(*self._loss.get_children())
+                self._loss_is_owned = True
 
-            prefix_base = name + '_auto_'
-            index = 0
             prefix = name
-            while prefix in self._loss:
+            if prefix in self._loss:
+                # same scheme as next_layer_name: resume from the last index
+                prefix_base = name + '_auto_'
+                index = self._loss_name_counters.get(name, 0)
                 prefix = prefix_base + str(index)
-                index += 1
-            loss_struct = schema.Struct((prefix, loss))
-            self._loss = self._loss + loss_struct
+                while prefix in self._loss:
+                    index += 1
+                    prefix = prefix_base + str(index)
+                self._loss_name_counters[name] = index + 1
+            self._loss = self._append_schema_field(self._loss, prefix, loss)
 
     def add_output_schema(self, name, value):
         assert value is not None, \
@@ -497,6 +573,12 @@ class LayerModelHelper(model_helper.ModelHelper):
                 if kwargs.get("params_to_metrics", False):
                     new_layer.export_params_for_metrics()
                 return self.add_layer(new_layer)
+            # __getattr__ is only consulted when the regular lookup fails, so
+            # caching the wrapper on the instance makes later accesses plain
+            # attribute lookups. Functional layers are not cached, as a layer
+            # registered later under the same name has to shadow them.
+            if not layer.startswith('_'):
+                self.__dict__[layer] = wrapper
             return wrapper
         elif is_functional_layer(layer):
             # TODO(xlwang): Desginated layer shadows the usage of an op as a
@@ -543,7 +625,7 @@ class LayerModelHelper(model_helper.ModelHelper):
         train_init_net,
         blob_to_device=None,
     ):
-        for param, regularizer in viewitems(self.param_to_reg):
+        for param, regularizer in self.param_to_reg.items():
             if regularizer is None:
                 continue
             assert isinstance(regularizer, Regularizer)
@@ -564,20 +646,20 @@ class LayerModelHelper(model_helper.ModelHelper):
     ):
         CPU = muji.OnCPU()
         # if given, blob_to_device is a map from blob to device_option
-        blob_to_device = blob_to_device or {}
-        for param, regularizer in viewitems(self.param_to_reg):
+        for param, regularizer in self.param_to_reg.items():
             if regularizer is None:
                 continue
             assert isinstance(regularizer, Regularizer)
+            grad = grad_map.get(str(param))
             device = get_param_device(
                 param,
-                grad_map.get(str(param)),
+                grad,
                 param_to_device=blob_to_device,
                 default_device=CPU,
             )
             with core.DeviceScope(device):
                 regularizer(
-                    train_net, train_init_net, param, grad=grad_map.get(str(param)),
+                    train_net, train_init_net, param, grad=grad,
                     by=RegularizationBy.AFTER_OPTIMIZER
                 )
 
@@ -619,15 +701,16 @@ class LayerModelHelper(model_helper.ModelHelper):
     ):
         CPU = muji.OnCPU()
         # if given, blob_to_device is a map from blob to device_option
-        blob_to_device = blob_to_device or {}
-        for param, optimizer in viewitems(self.param_to_optim):
+        for param, optimizer in self.param_to_optim.items():
             assert optimizer is not None, \
                 "default optimizer must have been set in add_layer"
             # note that not all params has gradient and thus we sent None if
-            # gradient does not exists
+            # gradient does not exists. param_to_optim is keyed by the param
+            # names already, so there is no need to str() them here
+            grad = grad_map.get(param)
             device = get_param_device(
                 param,
-                grad_map.get(str(param)),
+                grad,
                 param_to_device=blob_to_device,
                 default_device=CPU,
             )
@@ -636,8 +719,7 @@ class LayerModelHelper(model_helper.ModelHelper):
                 del device.extra_info[:]
 
             with core.DeviceScope(device):
-                optimizer(
-                    train_net, train_init_net, param, grad_map.get(str(param)))
+                optimizer(train_net, train_init_net, param, grad)
 
     def _GetOne(self):
         return self.global_constants['ONE']
@@ -656,5 +738,7 @@ class LayerModelHelper(model_helper.ModelHelper):
         # and change the assertion accordingly
         assert isinstance(breakdown_map, dict)
         assert all(isinstance(k, six.string_types) for k in breakdown_map)
-        assert sorted(breakdown_map.values()) == list(range(len(breakdown_map)))
+        # values have to be a permutation of range(len(breakdown_map)); as
+        # there are exactly len(breakdown_map) values, comparing sets is enough
+        assert set(breakdown_map.values()) == set(range(len(breakdown_map)))
         self._breakdown_map = breakdown_map
@@ -17,6 +17,7 @@ from caffe2.python import (
     schema,
     workspace,
 )
+from caffe2.proto import caffe2_pb2
 from caffe2.python.layers.layers import (
     InstantiationContext,
 )
@@ -113,6 +114,93 @@ class TestLayers(LayersTestCase):
         assert core.BlobReference('loss_blob_in_tuple_1')\
          in self.model.loss.field_blobs()
 
+    def testLayerAttributeIsCached(self):
+        fc = self.model.FC
+        # later accesses are served from the instance without __getattr__
+        self.assertIs(fc, self.model.__dict__['FC'])
+        self.assertIs(fc, self.model.FC)
+        # functional layers are resolved on every access
+        self.model.FunctionalLayerSplit
+        self.assertNotIn('FunctionalLayerSplit', self.model.__dict__)
+
+    def testMetricsAndLossAreExtendedInPlace(self):
+        # add_metric_field and add_loss append to the model's own Structs, so
+        # references taken earlier see the new fields
+        metrics = self.model.metrics_schema
+        self.model.add_metric_field(
+            'metric_a',
+            schema.Scalar(np.float32, core.BlobReference('metric_a_blob'))
+        )
+        self.assertIs(metrics, self.model.metrics_schema)
+        self.assertIn('metric_a', metrics)
+
+        self.model.add_loss(
+            schema.Scalar(np.float32, core.BlobReference('loss_a_blob')),
+            'loss_a'
+        )
+        loss = self.model.loss
+        self.model.add_loss(
+            schema.Scalar(np.float32, core.BlobReference('loss_b_blob')),
+            'loss_b'
+        )
+        self.assertIs(loss, self.model.loss)
+        self.assertIn('loss_b', loss)
+
+        # a loss Struct assigned by the caller is never modified
+        self.reset_model()
+        user_loss = schema.Struct(
+            ('loss_a', schema.Scalar(
+                np.float32, core.BlobReference('loss_a_blob'))),
+        )
+        self.model.loss = user_loss
+        self.model.add_loss(
+            schema.Scalar(np.float32, core.BlobReference('loss_b_blob')),
+            'loss_b'
+        )
+        self.assertNotIn('loss_b', user_loss)
+        self.assertIn('loss_b', self.model.loss)
+
+    def testMaybeAddGlobalConstant(self):
+        blob = self.model.maybe_add_global_constant(
+            'maybe_const', [1, 2, 3], dtype=np.int32)
+        self.assertEqual(
+            blob,
+            self.model.maybe_add_global_constant(
+                'maybe_const', np.array([1, 2, 3], dtype=np.int32))
+        )
+        # the second identical call is served from the stored fingerprint
+        self.assertEqual(
+            blob,
+            self.model.maybe_add_global_constant(
+                'maybe_const', [1, 2, 3], dtype=np.int32)
+        )
+        with self.assertRaises(AssertionError):
+            self.model.maybe_add_global_constant(
+                'maybe_const', [1, 2, 4], dtype=np.int32)
+        # same value, but the op would be created for a different device
+        with core.DeviceScope(core.DeviceOption(caffe2_pb2.CPU, 1)):
+            with self.assertRaises(AssertionError):
+                self.model.maybe_add_global_constant(
+                    'maybe_const', [1, 2, 3], dtype=np.int32)
+        self.assertEqual(
+            self.model.global_constants['ONE'],
+            self.model.maybe_add_global_constant('ONE', 1.0)
+        )
+
+    def testGlobalConstantFillOps(self):
+        expected_fill_ops = [
+            ('const_unicode', ['a', 'bc'], None, 'GivenTensorStringFill'),
+            ('const_bytes', [b'a', b'bc'], None, 'GivenTensorStringFill'),
+            ('const_int32', [1, 2], np.int32, 'GivenTensorIntFill'),
+            ('const_int64', [1, 2], np.int64, 'GivenTensorInt64Fill'),
+            ('const_bool', [True, False], None, 'GivenTensorBoolFill'),
+            ('const_float', [1.0, 2.0], None, 'GivenTensorFill'),
+        ]
+        for name, value, dtype, op_type in expected_fill_ops:
+            blob = self.model.add_global_constant(name, value, dtype=dtype)
+            self.assertEqual(
+                op_type, self.model.global_constant_initializers[blob].type)
+
     def testAddOutputSchema(self):
         # add the first field
         self.model.add_output_schema('struct', schema.Struct())
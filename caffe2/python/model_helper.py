@@ -204,7 +204,7 @@ class ModelHelper(object):
             param_name = parameter_sharing_context.get_parameter_name(
                 param_name)
         else:
-            raise "Unsupported type for param_name"
+            raise ValueError("Unsupported type for param_name")
 
         if param_name in self._parameters_info:
             assert self._parameters_info[param_name].shape == shape
@@ -465,6 +465,44 @@ class Struct(Field):
             raise TypeError('Struct.__setattr__() is disabled after __init__()')
         super(Struct, self).__setattr__(key, value)
 
+    def append_field(self, name, field):
+        """
+        Appends a new top-level field to this Struct, mutating it in place.
+
+        Unlike `+`, which returns a new Struct and leaves both operands
+        untouched, this does not rebuild the Struct, so the new field is
+        visible to everyone holding a reference to it, including any Struct
+        this one is nested in. Use `+` if the Struct may be shared.
+
+        Example:
+        s = Struct(('a', Scalar()))
+        s.append_field('b', Scalar())
+        s == Struct(
+            ('a', Scalar()),
+            ('b', Scalar()),
+        )
+        """
+        assert name, 'Field names cannot be empty'
+        assert name != 'lengths', (
+            'Struct cannot contain a field named `lengths`.'
+        )
+        assert FIELD_SEPARATOR not in name, (
+            'Nested name {} is not supported'.format(name))
+        if name in self.fields:
+            raise ValueError('Duplicate field name: %s' % name)
+        field = _normalize_field(field)
+        num_added = len(field.field_names())
+        self.fields[name] = field
+        field._set_parent(self, len(self.fields) - 1)
+        self._field_offsets.append(self._field_offsets[-1] + num_added)
+        # shift the offsets of the siblings following us in every ancestor
+        parent, child_index = self._parent
+        while parent:
+            offsets = parent._field_offsets
+            for i in range(child_index + 1, len(offsets)):
+                offsets[i] += num_added
+            parent, child_index = parent._parent
+
     def __add__(self, other):
         """
         Allows to merge fields of two schema.Struct using '+' operator.
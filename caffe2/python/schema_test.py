@@ -251,6 +251,28 @@ class TestDB(unittest.TestCase):
         with self.assertRaises(TypeError):
             s1 + schema.Scalar()
 
+    def testStructAppendField(self):
+        s = schema.Struct(
+            ('a', schema.Scalar()),
+            ('b', schema.Struct(
+                ('c', schema.Scalar()),
+                ('d', schema.Scalar()),
+            )),
+        )
+        s.append_field('e', schema.Scalar())
+        self.assertEqual(['a', 'b:c', 'b:d', 'e'], s.field_names())
+        self.assertEqual(s, schema.Struct(
+            ('a', schema.Scalar()),
+            ('b', schema.Struct(
+                ('c', schema.Scalar()),
+                ('d', schema.Scalar()),
+            )),
+            ('e', schema.Scalar()),
+        ))
+        self.assertEqual(slice(3, 4), s.e.slice())
+        with self.assertRaises(ValueError):
+            s.append_field('a', schema.Scalar())
+
     def testStructNestedAddition(self):
         s1 = schema.Struct(
             ('a', schema.Scalar()),